@@ -0,0 +1,916 @@
+"""
+This module contains the functions to download weather data from the
+Observation Data Inquire System (CODiS) of the Taiwanese Central Weather Bureau
+(CWB) and to write them station-wise into comma separated files. It is used by
+the script get_weather_data.py, which reads the configuration.
+
+Please see https://github.com/gpruss/codis for further information.
+"""
+
+
+
+################################### MODULES ####################################
+# standard library
+import csv
+import gzip
+import logging
+import re
+from bisect       import bisect_left
+from collections  import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime     import date, timedelta
+from itertools    import islice
+from mmap         import ACCESS_READ, mmap
+from os           import makedirs, path, remove, replace, truncate
+from urllib.parse import quote
+
+# third party libraries
+import lxml.html
+from numpy        import array, datetime64, isin, nan
+from pandas       import DataFrame, DatetimeIndex, to_numeric
+from requests     import RequestException, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+################################## CONSTANTS ###################################
+# progress messages are logged instead of printed, so that the calling script
+# decides where they go (see get_weather_data.py); without any configuration
+# they are discarded
+# note: the handlers write each message as a whole, the messages of the
+#       concurrent downloads therefore cannot be mixed up
+logger = logging.getLogger(__name__)
+logger.addHandler( logging.NullHandler() )
+
+# CODiS base URL (CWB Observation Data Inquire System, CWB = Central Weather
+# Bureau)
+base_URL = ( 'http://e-service.cwb.gov.tw/HistoryDataQuery/'
+            'DayDataController.do?command=viewMain' )
+
+# set the number of requests in flight at the same time (over all stations)
+# note: keep it moderate in order to stay polite to the CODiS server
+max_connections = 16
+
+# set the number of downloads submitted ahead of writing (over all stations):
+# enough to keep all connections busy while a station is written, while only
+# this many downloaded days are held in memory
+max_pending = 4 * max_connections
+
+# time limit (in seconds) for connecting to CODiS and for each read of a
+# response: a request that hangs is aborted (and retried, see below) instead
+# of stalling the whole download
+request_timeout = 20
+
+# create a session shared by all requests: HTTP keep-alive reuses the
+# connections to CODiS instead of opening a new one for every single day
+# note: the connection pool must not be smaller than the number of concurrent
+#       downloads, otherwise surplus connections are discarded after use
+# > retry connection errors, read errors (including timeouts) and server
+#   errors (5xx) up to three times with an exponentially growing delay (the
+#   first retry is immediate, then 2s and 4s) before giving up on a day
+session = Session()
+session.mount( 'http://', HTTPAdapter(
+    pool_connections = 1,
+    pool_maxsize     = max_connections,
+    max_retries      = Retry( total            = 3,
+                              backoff_factor   = 1,
+                              status_forcelist = (500, 502, 503, 504) ) ) )
+
+# identify the tool to the CODiS server instead of sending the generic
+# user agent of the requests library
+session.headers.update(
+    { 'User-Agent' : 'codis (https://github.com/gpruss/codis)' } )
+
+# minimum age of the days whose pages may be cached (see fetch_day): older
+# observations are not revised by CODiS any more
+cache_min_age = timedelta(days = 7)
+
+
+# The following objects are used for every single day that is downloaded.
+# Defining them once here spares building them anew for every page.
+
+# NA values of the CODiS tables (see the readme at
+# http://e-service.cwb.gov.tw/HistoryDataQuery/downloads/Readme.pdf)
+# > 'X': instrument malfunction
+# > 'V': wind with no mean wind direction
+# > '/': status unknown
+_NA_VALUES = ('X', 'V', '/')
+
+# replace the value of 'T', i.e. precipitation < 0.1mm ('trace'), by 0.05
+# (Kristen's choice)
+# note: columns are given by their translated names (see _COLUMN_RENAME)
+_REPLACEMENTS = { 'precipitation [mm]' : { 'T' : '0.05' } }
+
+# opening tag of the observation table
+_TABLE_START = re.compile(rb'<table[^>]*\bid\s*=\s*["\']?MyTable\b', re.I)
+
+# translation of the CODiS column headings
+_COLUMN_RENAME = {
+    '測站氣壓(hPa)StnPres'          : 'station pressure [hPa]'   ,
+    '海平面氣壓(hPa)SeaPres'        : 'sea level pressure [hPa]' ,
+    '氣溫(℃)Temperature'            : 'temperature [°C]'         ,
+    '露點溫度(℃)Td dew point'       : 'dew point [°C]'           ,
+    '相對溼度(%)RH'                 : 'relative humidity [%]'    ,
+    '風速(m/s)WS'                   : 'wind speed [m/s]'         ,
+    '風向(360degree)WD'             : 'wind direction [360°]'    ,
+    '最大陣風(m/s)WSGust'           : 'gust speed [m/s]'         ,
+    '最大陣風風向(360degree)WDGust' : 'gust direction [360°]'    ,
+    '降水量(mm)Precp'               : 'precipitation [mm]'       ,
+    '降水時數(hr)PrecpHour'         : 'precipitation hours [h]'  ,
+    '日照時數(hr)SunShine'          : 'sun shine hours [h]'      ,
+    '全天空日射量(MJ/㎡)GloblRad'   : 'global radiation [MJ/m²]' ,
+    '能見度(km)Visb'                : 'visibility [km]'          }
+
+
+############################# FUNCTION DEFINITIONS #############################
+def parse_codis_table(content):
+    """
+    Extract the observation table of a CODiS page (raw bytes). Returns a
+    DataFrame with the (translated) columns of the table, indexed by the hour of
+    the day. Raises a ValueError if the page holds no observation table.
+    """
+    # find the table of interest ('MyTable') in the raw page; error and
+    # maintenance pages do not contain it, so they fail before any parsing
+    match = _TABLE_START.search(content)
+
+    if match is None:
+        raise ValueError('no observation table in the response')
+
+    # cut the table out of the page, so that only this fragment has to be
+    # decoded (CODiS delivers UTF-8) and parsed instead of the whole page
+    end   = content.index(b'</table>', match.start()) + len(b'</table>')
+    table = lxml.html.fragment_fromstring(
+                content[match.start():end].decode('utf-8') )
+
+    # get the text of all cells, row by row
+    # note: collapse whitespace such as the trailing &nbsp; of the values
+    rows = [ [ ' '.join(cell.text_content().split()) for cell in tr ]
+             for tr in table.iter('tr') ]
+
+    # the first row holds a condensed heading, the second one the column names
+    header = rows[1]
+
+    # keep only the observation rows, i.e. skip the headings and messages
+    # like 'no observation data in this interval' that span the whole table
+    rows = [ row for row in rows[2:] if len(row) == len(header) ]
+
+    # translate the column names right away (see _COLUMN_RENAME)
+    columns = [ _COLUMN_RENAME.get(name, name) for name in header[1:] ]
+
+    # collect the values (still strings) in a single array of one row per hour
+    # note: the pages are small, so the NA values and the special values are
+    #       replaced on the array in bulk, which spares the overhead of the
+    #       equivalent DataFrame methods
+    values = array( [ row[1:] for row in rows ], dtype = object
+                  ).reshape( len(rows), len(columns) )
+
+    # replace the NA values by NaN (see _NA_VALUES)
+    values[ isin(values, _NA_VALUES) ] = nan
+
+    # replace the special values of single columns (see _REPLACEMENTS)
+    for name, replacements in _REPLACEMENTS.items():
+        if name in columns:
+            column = values[ :, columns.index(name) ]
+            for old, new in replacements.items():
+                column[ column == old ] = new
+
+    # create the DataFrame, using the first column, i.e. the hour of the day,
+    # as index, and convert the strings into numbers
+    tmp = DataFrame( data    = values,
+                     index   = [ int(row[0]) for row in rows ],
+                     columns = columns )
+
+    return tmp.apply( to_numeric, errors = 'coerce' )
+
+
+def station_url_prefix(station, stname):
+    """
+    Return the CODiS URL of a station (station: station ID, stname: station
+    name in Chinese characters) up to the date, which is appended per day (see
+    fetch_day).
+    """
+    # note: the station name is quoted twice
+    return ( f"{base_URL}&station={station}"
+             f"&stname={quote(quote(stname))}&datepicker=" )
+
+
+def fetch_day(day, station, url_prefix, cache_directory = None):
+    """
+    Download the observations of a single day from CODiS and return them as a
+    formatted DataFrame (None if there are no data for that day). The URL of
+    the station, up to the date, has to be assembled already (see
+    station_url_prefix). If a cache_directory is given, the pages of days older
+    than cache_min_age are read from and stored in it (gzip-compressed)
+    instead of being downloaded again. Raises a RequestException if the
+    download fails and a ValueError if the page holds no observation table.
+    """
+    # check the cache first
+    content = None
+
+    if cache_directory is not None and day < date.today() - cache_min_age:
+
+        cache_path = path.join( cache_directory,
+                                '{}_{}.html.gz'.format(station, day) )
+
+        # a missing or unreadable cache file is simply replaced below
+        try:
+            with gzip.open(cache_path, 'rb') as f:
+                content = f.read()
+
+            # indicate progress
+            logger.info( '> reading %s %s from cache', station, day )
+
+        except (OSError, EOFError):
+            pass
+
+    else:
+        cache_path = None
+
+    if content is None:
+
+        # indicate progress
+        logger.info( '> fetching %s %s', station, day )
+
+        # assemble URL: only the date differs from day to day
+        full_URL = url_prefix + day.isoformat()
+
+        # download the page through the shared session
+        response = session.get( full_URL, timeout = request_timeout )
+
+        response.raise_for_status()
+
+        content = response.content
+
+    else:
+
+        # the page is cached already
+        cache_path = None
+
+    # extract the observations from the page
+    tmp = parse_codis_table( content )
+
+    # store a downloaded page once it has proven to hold an observation table;
+    # the file is written under a temporary name and renamed afterwards, so
+    # that an interrupted run never leaves a truncated page behind
+    if cache_path is not None:
+
+        with gzip.open(cache_path + '.tmp', 'wb', compresslevel = 1) as f:
+            f.write(content)
+
+        replace( cache_path + '.tmp', cache_path )
+
+    # no observation data in this interval ( 本段時間區間內無觀測資料。)
+    if len(tmp) == 0:
+
+        # indicate progress
+        logger.info( '  ! no data for %s %s', station, day )
+
+        return None
+
+    # replace the index by the current date and time: the hours are simply
+    # added to the day (numpy datetime arithmetic instead of the generic
+    # conversion of to_datetime)
+    # note: '1' corresponds to 1:00 a.m., '2' is 2:00 a.m., etc. Be aware
+    #       that '12' is actually 0:00 a.m. the following day!
+    tmp.index = DatetimeIndex( datetime64(day) +
+                               tmp.index.values.astype('timedelta64[h]') )
+
+    # split DateTimeIndex into a date and a time column
+    # note: strftime is vectorized, building a MultiIndex would additionally
+    #       factorize both levels for nothing but the output
+    tmp.insert( 0, 'Date', tmp.index.strftime('%Y-%m-%d') )
+    tmp.insert( 1, 'Time', tmp.index.strftime('%H:%M') )
+
+    return tmp
+
+
+def failed_day_row(key, station, day, error):
+    """
+    Report a day that could not be downloaded and return its line of
+    failed_days.log (see record_failed_day): file name, station ID, date and
+    error.
+    """
+    # indicate progress
+    logger.warning( '  ! failed to fetch %s %s: %s', station, day, error )
+
+    # note: the csv-module quotes the error message if necessary, which is put
+    #       on a single line nevertheless (messages of exceptions may contain
+    #       line breaks)
+    return [ key, station, day.isoformat(), ' '.join(str(error).split()) ]
+
+
+def record_failed_day(data_directory, key, station, day, error):
+    """
+    Report a day that could not be downloaded and append it to the file
+    failed_days.log in data_directory (one CSV line per day: file name,
+    station ID, date and error). The days of the log are downloaded once more
+    at the beginning of the next run (see retry_failed_days).
+    """
+    row = failed_day_row( key, station, day, error )
+
+    with open( path.join(data_directory, 'failed_days.log'), 'a',
+               encoding = 'utf-8', newline = '' ) as log_file:
+        csv.writer(log_file).writerow(row)
+
+
+def write_last_observation(output_path, last_date):
+    """
+    Record the date of the last observation (bytes, YYYY-MM-DD) of a
+    compressed station file in its sidecar file (see read_last_observation).
+    """
+    with open(output_path + '.last', 'wb') as f:
+        f.write(last_date)
+
+
+def read_station_lines(output_path):
+    """
+    Return the complete lines (bytes, header included) of a station file. If
+    the file is damaged, e.g. by a truncated gzip member, the lines in front
+    of the damage are returned.
+    """
+    opener = gzip.open if output_path.endswith('.gz') else open
+
+    lines = []
+
+    try:
+        with opener(output_path, 'rb') as f:
+            lines.extend(f)
+
+    except EOFError:
+        pass
+
+    # drop an incomplete last line
+    if lines and not lines[-1].endswith(b'\n'):
+        lines.pop()
+
+    return lines
+
+
+def rewrite_station_file(output_path, lines):
+    """
+    Replace the content of a station file by lines (bytes, header included).
+    """
+    # compressed files (see station_path)
+    compress = output_path.endswith('.gz')
+
+    # write the file under a temporary name and replace the original one
+    # afterwards, so that an interruption cannot destroy the file
+    if compress:
+        output_file = gzip.open( output_path + '.tmp', 'wb',
+                                 compresslevel = 1 )
+    else:
+        output_file = open( output_path + '.tmp', 'wb' )
+
+    with output_file:
+        output_file.writelines(lines)
+
+    replace( output_path + '.tmp', output_path )
+
+    # the sidecar file of compressed files must not be older than the file
+    # itself (see read_last_observation)
+    if compress and len(lines) > 1:
+        write_last_observation( output_path, lines[-1][:10] )
+
+
+def insert_days(output_path, chunks):
+    """
+    Insert days (chunks of CSV lines without header, see write_station) into
+    the station file output_path at their chronological place. The file is
+    rewritten as a whole, so this is meant for a few days only.
+    """
+    header, *lines = read_station_lines(output_path)
+
+    for chunk in chunks:
+
+        new_lines = chunk.encode('utf-8').splitlines(keepends = True)
+
+        # the lines start with the date and the time of the observation
+        # (YYYY-MM-DD,HH:MM), which sort chronologically as they are
+        position = bisect_left( [ line[:16] for line in lines ],
+                                new_lines[0][:16] )
+
+        lines[position:position] = new_lines
+
+    rewrite_station_file( output_path, [header] + lines )
+
+
+def retry_failed_days(executor, station_list, data_directory, compress,
+                      cache_directory):
+    """
+    Download the days listed in failed_days.log (see record_failed_day) once
+    more and insert them into the station files (see insert_days). Days that
+    fail again remain in the log.
+    """
+    log_path = path.join( data_directory, 'failed_days.log' )
+
+    if not path.exists(log_path):
+        return
+
+    with open( log_path, encoding = 'utf-8', newline = '' ) as log_file:
+        entries = list( csv.reader(log_file) )
+
+    # lines to be kept in the log
+    remaining = []
+
+    # downloads per station file: {output_path : (key, station, {day :
+    # future})}
+    retries = {}
+
+    # date of the last observation per station file
+    last_observations = {}
+
+    for entry in entries:
+
+        # keep lines that cannot be retried: unreadable lines and stations
+        # that have been removed from (or changed in) the station_list
+        try:
+            key, station, day = entry[0], entry[1], date.fromisoformat(entry[2])
+            value = station_list[key]
+
+        except (IndexError, ValueError, KeyError):
+            remaining.append(entry)
+            continue
+
+        if value['station'] != station:
+            remaining.append(entry)
+            continue
+
+        output_path = station_path( data_directory, key, station, compress )
+
+        if output_path not in last_observations:
+
+            # keep the lines of damaged files (see read_last_observation)
+            try:
+                last_observations[output_path] = read_last_observation(
+                                                     output_path )
+
+            except ValueError:
+                last_observations[output_path] = False
+
+        last_observation = last_observations[output_path]
+
+        if last_observation is False:
+            remaining.append(entry)
+            continue
+
+        # the download is continued at the last observation anyway (see
+        # plan_station), only earlier days have to be inserted
+        if last_observation is None or day >= last_observation:
+            continue
+
+        downloads = retries.setdefault( output_path, (key, station, {}) )[2]
+
+        # each day once (the log may list a day several times)
+        if day not in downloads:
+
+            # indicate progress
+            logger.info( '> retrying %s %s', station, day )
+
+            downloads[day] = executor.submit( fetch_day, day, station,
+                                              station_url_prefix(
+                                                  station, value['stname'] ),
+                                              cache_directory )
+
+    for output_path, (key, station, downloads) in retries.items():
+
+        chunks = []
+
+        for day, future in sorted( downloads.items() ):
+
+            try:
+                tmp = future.result()
+
+            # the day fails again: keep it in the log
+            except (RequestException, ValueError, LookupError) as e:
+                remaining.append( failed_day_row(key, station, day, e) )
+                continue
+
+            # skip days without observation data
+            if tmp is not None:
+                chunks.append( tmp.to_csv( header = False, index = False ) )
+
+        if chunks:
+
+            insert_days( output_path, chunks )
+
+            # indicate progress
+            logger.info( '%s: %d failed day(s) inserted into %s',
+                         key.upper(), len(chunks), output_path )
+
+    # rewrite the log with the remaining lines (or remove it)
+    if remaining:
+
+        with open( log_path, 'w', encoding = 'utf-8',
+                   newline = '' ) as log_file:
+            csv.writer(log_file).writerows(remaining)
+
+    else:
+        remove(log_path)
+
+
+def station_path(data_directory, key, station, compress = False):
+    """
+    Return the path of the file of a station (key: file name, station:
+    station ID). Compressed files get the extension .csv.gz.
+    """
+    return path.join( data_directory, '{}_{}.csv{}'.format(
+                          key, station, '.gz' if compress else '' ) )
+
+
+def read_last_observation(output_path):
+    """
+    Return the date of the last observation of a station file, or None if the
+    file does not exist or holds no observations yet. A file that has been
+    cut by an interrupted run is repaired on the way, i.e. cut back to its
+    last complete day. Raises a ValueError if the file is damaged otherwise.
+    """
+    # compressed files (see station_path) cannot be read from the end: the
+    # date of the last observation is kept in a sidecar file instead, which
+    # is written after the station file has been closed (see write_station)
+    if output_path.endswith('.gz'):
+
+        # no file, no observations (a file holding only the gzip header
+        # is handled by the scan below)
+        if not path.exists(output_path):
+            return None
+
+        last_path = output_path + '.last'
+
+        # the sidecar file is valid if it has not been written before the
+        # station file was last modified (otherwise the last download has
+        # been interrupted)
+        if ( path.exists(last_path) and
+             path.getmtime(last_path) >= path.getmtime(output_path) ):
+
+            with open(last_path, 'rb') as f:
+                lastObservation = f.read(10)
+
+        else:
+
+            # fall back to decompressing the whole file and keeping its last
+            # complete line
+            # note: appended gzip members are read one after the other
+            lastObservation = None
+            line_count      = 0
+
+            try:
+                with gzip.open(output_path, 'rb') as f:
+                    for line in f:
+                        if line.endswith(b'\n'):
+                            line_count     += 1
+                            lastObservation = line[:10]
+
+            # an interrupted run leaves a truncated gzip member behind, which
+            # would hide everything appended to the file later on: rewrite the
+            # file with the complete days in front of the damage (the days
+            # that are lost are downloaded again)
+            except EOFError as e:
+
+                # indicate progress
+                logger.warning( '  ! repairing %s: %s', output_path, e )
+
+                lines = read_station_lines(output_path)
+
+                # cut the lines of an incomplete day: the last line of a day
+                # is hour 24, i.e. 00:00 of the following day, which is where
+                # the download continues (see plan_station)
+                while len(lines) > 1 and lines[-1][11:16] != b'00:00':
+                    lines.pop()
+
+                rewrite_station_file( output_path, lines )
+
+                line_count      = len(lines)
+                lastObservation = lines[-1][:10] if lines else None
+
+            # any other damage cannot be repaired safely
+            except OSError as e:
+                raise ValueError( 'damaged station file {}: {}'.format(
+                                      output_path, e ) )
+
+            # no observations below the header
+            if line_count <= 1:
+                return None
+
+            # keep the date for the next time
+            write_last_observation( output_path, lastObservation )
+
+    # check file exists (and holds observations, the file is opened before the
+    # first day is written)
+    elif path.exists(output_path) and path.getsize(output_path) > 0:
+
+        # fetch the last observation from the file without reading it: the
+        # file is memory-mapped and the line breaks are searched backwards,
+        # so only the pages at the end of the file are touched
+        # note: mmap cannot map empty files, which is why the size is checked
+        #       above
+        with open(output_path,'rb') as f, \
+             mmap(f.fileno(), 0, access = ACCESS_READ) as mm:
+
+            size = len(mm)
+
+            # position behind the last complete line (an interrupted run may
+            # have cut the file at any byte)
+            end   = mm.rfind(b'\n') + 1
+            start = 0
+
+            # go back to the last line of a complete day: the last line of a
+            # day is hour 24, i.e. 00:00 of the following day, which is where
+            # the download continues (see plan_station); usually this is the
+            # very last line
+            while end > 0:
+
+                start = mm.rfind(b'\n', 0, end - 1) + 1
+
+                if start == 0 or mm[start + 11:start + 16] == b'00:00':
+                    break
+
+                end = start
+
+            # extract the date, i.e. the first 10 characters of the line
+            lastObservation = mm[start:start + 10]
+
+        # cut off an incomplete day (or line) left behind by an interrupted
+        # run, the cut days are downloaded again
+        if end < size:
+
+            # indicate progress
+            logger.warning( '  ! repairing %s: cutting off %d bytes of an '
+                            'incomplete day', output_path, size - end )
+
+            truncate( output_path, end )
+
+        # no observations below the header
+        if start == 0:
+            return None
+
+    else:
+        return None
+
+    # convert the date from an ISO string (YYYY-MM-DD) to a date object
+    try:
+        return date.fromisoformat(lastObservation.decode('utf-8'))
+
+    except ValueError as e:
+        raise ValueError( 'damaged station file {}: {}'.format(
+                              output_path, e ) )
+
+
+def plan_station(key, station, stname, start_date, end_date, output_path):
+    """
+    Determine the download period of a single station (key: file name,
+    station: station ID, stname: station name in Chinese characters). If the
+    file (output_path) exists already, the download continues after its last
+    observation. Returns the URL of the station up to the date (see
+    fetch_day), the first day, the number of days to be downloaded, which is
+    0 if the file is up to date (or damaged), and whether the days are
+    appended to an existing file (see write_station).
+    """
+    # indicate progress
+    logger.info( '> processing %s', key.upper() )
+
+    # assemble the URL of the station once for all days, only the date is
+    # appended per day
+    url_prefix = station_url_prefix( station, stname )
+
+    # continue the download at the last observation of the file or, if there
+    # is none, start it at the configured start date
+    try:
+        first_day = read_last_observation(output_path)
+
+    # a damaged file must not abort the other stations: skip the station
+    except ValueError as e:
+
+        # indicate progress
+        logger.error( '  ! skipping %s: %s', key.upper(), e )
+
+        return url_prefix, start_date, 0, False
+
+    append = first_day is not None
+
+    if not append:
+        first_day = start_date
+
+
+    # check download period: Stop here if the file is up to date
+    if first_day > end_date:
+
+        # indicate progress
+        logger.info( '%s: file is already up to date.', key.upper() )
+
+        return url_prefix, first_day, 0, append
+
+    return ( url_prefix, first_day, (end_date - first_day).days + 1,
+             append )
+
+
+def submit_window(executor, tasks, max_pending):
+    """
+    Submit the downloads of the tasks (arguments of fetch_day) to the executor
+    and yield (day, future) pairs in the order of the tasks. At most
+    max_pending downloads are submitted ahead of the consumer, so that only
+    a limited number of downloaded days is held in memory at any time.
+    """
+    pending = deque()
+
+    for task in tasks:
+
+        # task[0] is the day (see fetch_day)
+        pending.append( (task[0], executor.submit( fetch_day, *task )) )
+
+        # hand out the oldest download once the window is full; the next one
+        # is only submitted when the consumer asks for another day
+        if len(pending) >= max_pending:
+            yield pending.popleft()
+
+    # hand out the rest
+    while pending:
+        yield pending.popleft()
+
+
+def write_station(key, station, downloads, data_directory, output_path,
+                  append):
+    """
+    Wait for the downloads of a single station, (day, future) pairs in the
+    order of the period (see submit_window), and write them to the file of
+    the station (output_path, compressed if it ends with .gz). If append is
+    set, the file holds observations already (see plan_station).
+    """
+    if append:
+
+        # set the file mode:
+        # append to the existing file (do not overwrite)
+        access_mode = 'a'
+
+        # do not print a header
+        write_header = False
+
+    else:
+
+        # set the file mode:
+        # create a new file
+        access_mode = 'w'
+
+        # print a header
+        write_header = True
+
+    # open the file once for the whole period
+    # note: newline='' hands the line endings of to_csv through unchanged, as
+    #       recommended for csv writers (no translation to '\r\n' on Windows)
+    if output_path.endswith('.gz'):
+
+        # compress on the fly; appending adds a new gzip member to the file,
+        # which readers simply concatenate
+        # note: the lowest compression level is by far the fastest and still
+        #       shrinks the files several times
+        output_file = gzip.open( output_path, access_mode + 't',
+                                 compresslevel = 1, encoding = 'utf-8',
+                                 newline = '' )
+
+    else:
+
+        # the large buffer collects the output of several days before it is
+        # handed to the operating system
+        output_file = open( output_path, access_mode, buffering = 1 << 20,
+                            encoding = 'utf-8', newline = '' )
+
+    # date of the last observation written
+    last_date = None
+
+    with output_file:
+
+        for day, future in downloads:
+
+            try:
+                tmp = future.result()
+
+            # a single failed day must not abort the whole station: skip it
+            # and record it for the next run (see retry_failed_days)
+            except (RequestException, ValueError, LookupError) as e:
+                record_failed_day( data_directory, key, station, day, e )
+                continue
+
+            # skip days without observation data
+            if tmp is None:
+                continue
+
+            # write the day straight to the file instead of buffering the
+            # whole period in a DataFrame; an interrupted download thus keeps
+            # all the days that have been completed
+            tmp.to_csv( output_file, header = write_header, index = False )
+
+            # the header is only needed once
+            write_header = False
+
+            # remember the date of the last line
+            last_date = tmp['Date'].iloc[-1]
+
+    # compressed files: record the last observation in the sidecar file (see
+    # read_last_observation), once the station file is complete
+    if output_path.endswith('.gz') and last_date is not None:
+
+        write_last_observation( output_path, last_date.encode('utf-8') )
+
+    # indicate progress
+    logger.info( '%s: data written to %s', key.upper(), output_path )
+
+
+def fetch_station(key, station, stname, start_date, end_date, data_directory,
+                  compress = False):
+    """
+    Download the observations of a single station (key: file name, station:
+    station ID, stname: station name in Chinese characters) from start_date to
+    end_date and append them to its file in data_directory. If the file exists
+    already, the download continues after its last observation.
+    """
+    # create the data directory if it does not exist yet
+    makedirs( data_directory, exist_ok = True )
+
+    output_path = station_path( data_directory, key, station, compress )
+
+    url_prefix, first_day, days, append = \
+        plan_station( key, station, stname, start_date, end_date, output_path )
+
+    if not days:
+        return
+
+    # the same sliding window of downloads as in process_stations, on a pool
+    # of threads of its own
+    with ThreadPoolExecutor( max_workers = max_connections ) as executor:
+
+        tasks = ( (first_day + timedelta(days = i), station,
+                   url_prefix, None)
+                  for i in range(days) )
+
+        write_station( key, station,
+                       submit_window( executor, tasks, max_pending ),
+                       data_directory, output_path, append )
+
+
+def process_stations(station_list, start_date, end_date, data_directory,
+                     compress = False, cache = False):
+    """
+    Download the observations of all stations of the station_list (see
+    config.json) and write them into station files in data_directory
+    (gzip-compressed if compress is set). If cache is set, the downloaded
+    pages are kept in data_directory/.cache (see fetch_day).
+    """
+    # create the data directory if it does not exist yet
+    if not path.isdir( data_directory ):
+
+        # indicate progress
+        logger.info( '\ncreating data directory: %s', data_directory )
+
+        # create the directory
+        makedirs( data_directory )
+
+    # create the cache directory if required
+    if cache:
+        cache_directory = path.join( data_directory, '.cache' )
+        makedirs( cache_directory, exist_ok = True )
+
+    else:
+        cache_directory = None
+
+
+    # all days of all stations form a single queue of downloads, which are
+    # carried out concurrently by one pool of threads (the download is network
+    # bound): there are always max_connections requests in flight, no matter
+    # how the days are distributed over the stations
+    with ThreadPoolExecutor( max_workers = max_connections ) as executor:
+
+        # fill the gaps left by days that failed in previous runs
+        retry_failed_days( executor, station_list, data_directory, compress,
+                           cache_directory )
+
+        # determine the download periods of all stations first ...
+        jobs = []
+
+        for key, value in station_list.items():
+
+            output_path = station_path( data_directory, key, value['station'],
+                                        compress )
+
+            jobs.append( (key, value['station'], output_path) +
+                         plan_station( key, value['station'], value['stname'],
+                                       start_date, end_date, output_path ) )
+
+        # ... then line up the days of all stations in the order they are
+        # written (lazily, the days are created while the downloads proceed)
+        tasks = ( (first_day + timedelta(days = i), station,
+                   url_prefix, cache_directory)
+                  for key, station, output_path, url_prefix,
+                      first_day, days, append in jobs
+                  for i in range(days) )
+
+        # keep a window of max_pending downloads submitted ahead of writing:
+        # the downloads of the following stations proceed while a station is
+        # written, but a day is released as soon as it has been written
+        downloads = submit_window( executor, tasks, max_pending )
+
+        # write the stations one after the other, each one takes its days
+        # from the front of the queue
+        for key, station, output_path, url_prefix, first_day, days, \
+                append in jobs:
+
+            if days:
+                write_station( key, station, islice(downloads, days),
+                               data_directory, output_path, append )
@@ -14,457 +14,394 @@ Please see https://github.com/gpruss/codis for further information.
 
 ################################### MODULES ####################################
 # standard library
+import logging
 import sys
+from dataclasses  import dataclass, replace
 from datetime     import date, datetime, timedelta
-from json         import load, JSONDecodeError
-from os           import makedirs, path
+from functools    import lru_cache
+from json         import JSONDecodeError
+from os           import path, stat
 from textwrap     import fill
-from urllib.parse import quote
+from types        import MappingProxyType
 
-# third party libraries
-# note: html5lib needs to be included in the requirements.txt because Pandas
-#       uses it if lxml fails parsing.
-from pandas       import ( DataFrame, MultiIndex, Timestamp, date_range,
-                           read_html, to_datetime )
-
-############################# FUNCTION DEFINITIONS #############################
-def term_print(text, line_width = 80):
-    """
-    Print strings with a predefined line width.
-    """
-    for paragraph in str.splitlines(text):
-        print(fill(paragraph, width = line_width))
-
-
-########################### READ CONFIGURATION FILE ############################
-# JSON files (JavaScript Object Notation) are easy to read and the json-module
-# is part of the Python Standard library. To facilitate code maintenance with
-# git all user configuration is transfered to the file './config.json'.
-
-# get script directory
-script_directory = path.dirname(path.realpath(__file__))
+# optional third party libraries
+# note: orjson parses JSON faster than the json-module (its JSONDecodeError is
+#       a subclass of the one of the json-module)
+try:
+    from orjson   import loads
+except ImportError:
+    from json     import loads
 
+# download functions (see ./codis.py)
+from codis        import process_stations
 
-# indicate progress
-# display a header consisting of the current date padded with hyphens
-term_print(('\n{:-^80}'.format(datetime.now().strftime('%Y-%m-%d %H:%M'))))
+################################## CONSTANTS ###################################
+# answers accepted when start_date is after end_date (see load_config)
+_ACTIONS = { 's' : 'swap', '[s]' : 'swap',
+             'q' : 'quit', '[q]' : 'quit' }
 
-# indicate progress
-term_print('Reading configuration file:')
+############################### CLASS DEFINITIONS ##############################
+class ConfigError(Exception):
+    """
+    Raised if the configuration file is missing or invalid. The message tells
+    the user how to correct config.json.
+    """
 
-# read the configuration file (returns a dictionary)
-try:
-    with open(path.join(script_directory, 'config.json')) as config_file:
-            config = load(config_file)
 
-except FileNotFoundError:
-    err_message = ('\nError: configuration file missing!\n\nCreate a file '
-                   'called config.json in {} and specify (at least) the '
-                   'stations to be downloaded. For further details see: '
-                   'https://github.com/gpruss/codis.'
-                  ).format(script_directory)
-    term_print(err_message)
-    sys.exit(1)
+class Cancelled(Exception):
+    """
+    Raised if the user decides to quit the program (see load_config).
+    """
 
-except JSONDecodeError as e:
 
-    # create error message
-    err_message = ('Error: invalid configuration file config.json\n\nPython '
-                   'is unable to parse your configuration file:\n{}'
-                  ).format(e)
+@dataclass(frozen = True)
+class Config:
+    """
+    Validated configuration (see config.json and parse_config): the fields
+    cannot be reassigned and the station_list is a read-only mapping.
+    """
+    data_directory : str
+    start_date     : date
+    end_date       : date
+    station_list   : MappingProxyType
+    compress       : bool = False
+    cache          : bool = False
 
-    # display error message
-    term_print(err_message)
 
-    # cancel script execution
-    sys.exit(1)
+############################# FUNCTION DEFINITIONS #############################
+def term_print(text, line_width = 80):
+    """
+    Print strings with a predefined line width.
+    """
+    for paragraph in str.splitlines(text):
+        print(fill(paragraph, width = line_width))
 
 
-# get the data_directory
-if 'data_directory' in config:
-    data_directory = config['data_directory']
+def read_config_file(config_path):
+    """
+    Read the JSON configuration file and return its content as a dictionary.
+    Raises a ConfigError if the file is missing or invalid.
+    """
+    try:
+        # note: read bytes, JSON is always UTF-8 encoded (the file contains
+        #       Chinese station names), so the locale does not matter
+        with open(config_path, 'rb') as config_file:
+            return loads(config_file.read())
+
+    except FileNotFoundError:
+        err_message = ('\nError: configuration file missing!\n\nCreate a file '
+                       'called {} in {} and specify (at least) the stations '
+                       'to be downloaded. For further details see: '
+                       'https://github.com/gpruss/codis.'
+                      ).format( path.basename(config_path),
+                                path.dirname(path.abspath(config_path)) )
+        raise ConfigError(err_message)
+
+    except JSONDecodeError as e:
 
-else:
-    # if no data directory has been specified, default to
-    # '/my/path/to/CODiS/data/'
-    data_directory = path.join( script_directory, 'data')
+        # create error message
+        err_message = ('Error: invalid configuration file {}\n\n'
+                       'Python is unable to parse your configuration file:\n{}'
+                      ).format(path.basename(config_path), e)
 
-# indicate progress
-print( '> data directory:', data_directory)
+        # cancel script execution
+        raise ConfigError(err_message)
 
 
-# get the start date
-# If no start date has been specified, default to January 1, 2010, because
-# there are no older observation data available at CODiS than that!
-# note: If data files are already present start_date will be overridden later
-#       by the last observation of the file, i.e. the download will be con-
-#       tinued!
-if 'start_date' in config:
+def parse_bounded_date(config, key, min_date, max_date, default):
+    """
+    Read the date config[key] (format: YYYY-MM-DD) and check that it lies
+    between min_date and max_date. Returns default if the key is missing.
+    Raises a ConfigError if the date is invalid or out of bounds.
+    """
+    # set the default value
+    if key not in config:
+        return default
 
     try:
 
         # convert string into a date object
-        start_date = datetime.strptime(config['start_date'], '%Y-%m-%d').date()
+        value = date.fromisoformat(config[key])
 
     except ValueError:
 
         # create error message
-        err_message = ('\nError: start_date given in unknown format ({})\n\n'
-                       'Please edit your config.json and use the following '
-                       'date format: "YYYY-MM-DD", e.g. "2010-01-01"!'
-                      ).format(config["start_date"])
-
-        # display error message
-        term_print(err_message)
+        err_message = ('\nError: {} given in unknown format ({})\n\nPlease '
+                       'edit your config.json and use the following date '
+                       'format: "YYYY-MM-DD", e.g. "2010-01-01"!'
+                      ).format(key, config[key])
 
         # cancel script execution
-        sys.exit(1)
+        raise ConfigError(err_message)
 
 
-    # sanity check: start_date must not be prior to 2010-01-01
-    if start_date < date(2010,1,1):
+    # sanity check: the date must lie within the available period
+    if not (min_date <= value <= max_date):
 
         # create error message
-        err_message = ('\nError: start_date out of bounds ({})\n\nPlease edit '
-                       'your config.json and choose a start_date that is not '
-                       'earlier than January 1, 2010.').format(start_date)
-
-        # display error message
-        term_print(err_message)
+        err_message = ('\nError: {} out of bounds ({})\n\nPlease edit your '
+                       'config.json and choose a value for {} that is '
+                       'neither earlier than {} nor later than {}, i.e. the '
+                       'day before yesterday (CODiS updates are not that '
+                       'fast).').format(key, value, key, min_date, max_date)
 
         # cancel script execution
-        sys.exit(1)
-
-    # sanity check: start_date must not be later than the day before yesterday
-    # note: see end_date for details
-    if start_date > (date.today() - timedelta(days=2)):
+        raise ConfigError(err_message)
 
-        # create error message
-        err_message = ('\nError: start_date out of bounds ({})\n\nPlease edit '
-                       'your config.json and choose a start_date that is not '
-                       'later than the day before yesterday (CODiS updates '
-                       'are not that fast).').format(start_date)
+    return value
 
-        # display error message
-        term_print(err_message)
 
-        # cancel script execution
-        sys.exit(1)
+def parse_flag(config, key, default = False):
+    """
+    Read the boolean config[key]. Returns default if the key is missing.
+    Raises a ConfigError if the value is neither true nor false.
+    """
+    value = config.get(key, default)
 
-else:
+    if not isinstance(value, bool):
 
-    # set the default value
-    start_date = date(2010,1,1)
+        # create error message
+        err_message = ('\nError: {} must be either true or false ({})\n\n'
+                       'Please edit your config.json.').format(key, value)
 
-# indicate progress
-print( '> start date    :', start_date)
+        # cancel script execution
+        raise ConfigError(err_message)
 
+    return value
 
-# get the end date
-# If no end date has been specified, default to the day before yesterday,
-# because data are updated at 12:00 noon. Therefore using the day before
-# yesterday, i.e. date.today() - timedelta(days=2), should be safe regardless
-# of the local time.
-if 'end_date' in config:
 
-    try:
+@lru_cache(maxsize = 1)
+def parse_config(config_path, mtime_ns, today):
+    """
+    Read and validate the configuration file and return it as a Config.
+    Missing optional values are replaced by their defaults. The result is
+    cached per version of the file (mtime_ns) and per day (today, the dates
+    are checked against it), so that an edited file or a new day leads to a
+    new result. Raises a ConfigError if the configuration is invalid.
+    """
+    # read the configuration file (returns a dictionary)
+    config = read_config_file(config_path)
 
-        # convert string into a date object
-        end_date = datetime.strptime(config['end_date'], '%Y-%m-%d').date()
+    # get the earliest and the latest date available at CODiS, i.e. January 1,
+    # 2010, and the day before yesterday
+    # (see end_date for details)
+    # note: the current date is determined only once (see load_config), so
+    #       that all checks refer to the same day even if the script is
+    #       started around midnight
+    min_date = date(2010,1,1)
+    max_date = today - timedelta(days=2)
 
-    except ValueError:
 
-        # create error message
-        err_message = ('\nError: end_date given in unknown format ({})\n\n'
-                       'Please edit your config.json and use the following '
-                       'date format: "YYYY-MM-DD", e.g. "2017-01-01"!'
-                      ).format(config["end_date"])
+    # get the data_directory
+    if 'data_directory' in config:
+        data_directory = config['data_directory']
 
-        # display error message
-        term_print(err_message)
+    else:
+        # if no data directory has been specified, default to
+        # '/my/path/to/CODiS/data/'
+        data_directory = path.join( path.dirname(config_path), 'data')
 
-        # cancel script execution
-        sys.exit(1)
 
+    # get the start date
+    # If no start date has been specified, default to January 1, 2010, because
+    # there are no older observation data available at CODiS than that!
+    # note: If data files are already present start_date will be overridden
+    #       later by the last observation of the file, i.e. the download will
+    #       be continued!
+    start_date = parse_bounded_date( config, 'start_date', min_date, max_date,
+                                     default = min_date )
 
-    # sanity check: end_date must not be later than the day before yesterday
-    if end_date > (date.today() - timedelta(days=2)):
 
-        # create error message
-        err_message = ('\nError: end_date out of bounds ({})\n\nPlease edit your '
-                       'config.json and choose an end_date that is not later '
-                       'than the day before yesterday (CODiS updates are not '
-                       'that fast).').format(end_date)
+    # get the end date
+    # If no end date has been specified, default to the day before yesterday,
+    # because data are updated at 12:00 noon. Therefore using the day before
+    # yesterday, i.e. date.today() - timedelta(days=2), should be safe
+    # regardless of the local time.
+    # note: end_date may be prior to start_date (see load_config)
+    end_date = parse_bounded_date( config, 'end_date', min_date, max_date,
+                                   default = max_date )
 
-        # display error message
-        term_print(err_message)
 
-        # cancel script execution
-        sys.exit(1)
+    # get the station list
+    if 'station_list' in config:
 
-else:
+        station_list = config['station_list']
 
-    # set the default value
-    end_date   = date.today() - timedelta(days=2)
+        if len(station_list) < 1:
 
-# indicate progress
-print( '> end date      :', end_date)
+            # create error message
+            err_message = ('\nError: station_list is empty\n\nPlease edit '
+                           'your config.json and add all stations to be '
+                           'downloaded:\n"station_list" : {\n    "[file_1]" : '
+                           '{"station" : "[ID_1]", "stname" : '
+                           '"[hanzi_name_1]"},\n    "[file_2]" : {"station" : '
+                           '"[ID_2]", "stname" : "[hanzi_name_2]"},\n    ...\n'
+                           '    "[file_n]" : {"station" : "[ID_n]", "stname" : '
+                           '"[hanzi_name_n]"},\n }')
 
+            # cancel script execution
+            raise ConfigError(err_message)
 
-# sanity check: end_date must be after start_date
-if start_date > end_date:
+    else:
 
-    term_print(('\nError: start_date ({}) is after end_date ({}).'
-               ).format(start_date,end_date))
+        # create error message
+        err_message = ('\nError: station_list not defined\n\nPlease edit your '
+                       'config.json and add all stations to be downloaded:\n'
+                       '"station_list" : {'
+                       '\n    "[file_1]" : {"station" : "[ID_1]", "stname" : '
+                       '"[hanzi_name_1]"},\n    "[file_2]" : {"station" : "[ID_2]"'
+                       ', "stname" : "[hanzi_name_2]"},\n    ...\n    "[file_n]" :'
+                       ' {"station" : "[ID_n]", "stname" : "[hanzi_name_n]"},\n }'
+                      )
 
-    # present the choice to swap or to quit
-    user_input = input('Do you want to ...\n[s] swap the values, or\n'
-                       '[q] quit the program?\n')
+        # cancel script execution
+        raise ConfigError(err_message)
 
-    # repeat until a valid input has been given
-    while True:
 
-        # user decides to swap the values of start_date and end_date
-        if (user_input.lower() == 's') or (user_input.lower() == '[s]'):
+    # get the compression flag
+    # If not specified, the station files are written as plain CSV files;
+    # otherwise they are gzip-compressed (extension .csv.gz).
+    compress = parse_flag( config, 'compress' )
 
-            start_date, end_date = end_date, start_date
+    # get the cache flag
+    # If specified, the downloaded pages of days older than a week are kept in
+    # data_directory/.cache and read from there if they are needed again.
+    cache = parse_flag( config, 'cache' )
 
-            # exit the loop
-            break
+    return Config( data_directory = data_directory,
+                   start_date     = start_date,
+                   end_date       = end_date,
+                   station_list   = MappingProxyType(station_list),
+                   compress       = compress,
+                   cache          = cache )
 
-        # user decides to quit the program
-        elif (user_input.lower() == 'q') or (user_input.lower() == '[q]'):
 
-            quit()
+def load_config(config_path):
+    """
+    Return the validated configuration (see parse_config) and display it. If
+    start_date is after end_date, the user is asked whether to swap the
+    values. Raises a ConfigError if the configuration is invalid and
+    Cancelled if the user decides to quit instead.
+    """
+    # the version of the file and the current day are part of the cache key
+    # of parse_config
+    try:
+        mtime_ns = stat(config_path).st_mtime_ns
 
-        # user does something different
-        else:
+    # reported by read_config_file
+    except FileNotFoundError:
+        mtime_ns = None
 
-            # input not recognized
-            user_input = input( ('Input not recognized. Please type either [s]'
-                                 ' to switch, or [q] to quit. ') )
+    config = parse_config( config_path, mtime_ns, date.today() )
 
+    # indicate progress
+    print( '> data directory:', config.data_directory)
+    print( '> start date    :', config.start_date)
+    print( '> end date      :', config.end_date)
 
-# get the station list
-if 'station_list' in config:
 
-    station_list = config['station_list']
+    # sanity check: end_date must be after start_date
+    if config.start_date > config.end_date:
 
-    if len(station_list) < 1:
+        term_print(('\nError: start_date ({}) is after end_date ({}).'
+                   ).format(config.start_date,config.end_date))
 
-        # create error message
-        err_message = ('\nError: station_list is empty\n\nPlease edit your '
-                       'config.json and add all stations to be downloaded:\n'
-                       '"station_list" : {'
-                       '\n    "[file_1]" : {"station" : "[ID_1]", "stname" : '
-                       '"[hanzi_name_1]"},\n    "[file_2]" : {"station" : "[ID_2]"'
-                       ', "stname" : "[hanzi_name_2]"},\n    ...\n    "[file_n]" :'
-                       ' {"station" : "[ID_n]", "stname" : "[hanzi_name_n]"},\n }'
-                      )
+        # present the choice to swap or to quit
+        user_input = input('Do you want to ...\n[s] swap the values, or\n'
+                           '[q] quit the program?\n')
 
-        # display error message
-        term_print(err_message)
+        # repeat until a valid input has been given (see _ACTIONS)
+        while True:
 
-        # cancel script execution
-        sys.exit(1)
+            action = _ACTIONS.get( user_input.strip().lower() )
 
-else:
+            # user decides to swap the values of start_date and end_date
+            if action == 'swap':
 
-    # create error message
-    err_message = ('\nError: station_list not defined\n\nPlease edit your '
-                   'config.json and add all stations to be downloaded:\n'
-                   '"station_list" : {'
-                   '\n    "[file_1]" : {"station" : "[ID_1]", "stname" : '
-                   '"[hanzi_name_1]"},\n    "[file_2]" : {"station" : "[ID_2]"'
-                   ', "stname" : "[hanzi_name_2]"},\n    ...\n    "[file_n]" :'
-                   ' {"station" : "[ID_n]", "stname" : "[hanzi_name_n]"},\n }'
-                  )
+                config = replace( config, start_date = config.end_date,
+                                          end_date   = config.start_date )
 
-    # display error message
-    term_print(err_message)
+                # exit the loop
+                break
 
-    # cancel script execution
-    sys.exit(1)
+            # user decides to quit the program
+            elif action == 'quit':
 
+                raise Cancelled()
 
-##################################### MAIN #####################################
-# set CODiS base URL (CWB Observation Data Inquire System, CWB = Central Weather
-# Bureau)
-base_URL = ( 'http://e-service.cwb.gov.tw/HistoryDataQuery/'
-            'DayDataController.do?command=viewMain' )
+            # user does something different
+            else:
 
+                # input not recognized
+                user_input = input( ('Input not recognized. Please type '
+                                     'either [s] to switch, or [q] to quit. ') )
 
-# create the data directory if it does not exist yet
-if not path.isdir( data_directory ):
 
     # indicate progress
-    print('\ncreating data directory: {}'.format(data_directory))
+    print( '> compress      :', config.compress)
+    print( '> cache         :', config.cache)
 
-    # create the directory
-    makedirs( data_directory )
+    return config
 
 
-# loop over all stations in station_list
-for key, value in station_list.items():
-
-    # indicate progress
-    print('\n' + key.upper() )
+##################################### MAIN #####################################
+def main(config_path = None):
+    """
+    Read the configuration file (default: config.json in the script directory)
+    and download the observations of all stations. Returns the exit status of
+    the script.
+    """
+    # JSON files (JavaScript Object Notation) are easy to read and the
+    # json-module is part of the Python Standard library. To facilitate code
+    # maintenance with git all user configuration is transfered to the file
+    # './config.json'.
+    if config_path is None:
 
-    # create output path
-    output_path = path.join( data_directory,
-                             '{}_{}.csv'.format(key, value['station']) )
+        # get script directory
+        script_directory = path.dirname(path.realpath(__file__))
 
-    # check file exists
-    if path.exists(output_path):
+        config_path = path.join(script_directory, 'config.json')
 
-        # set parameters for the to_csv-method:
-        # append to the existing file (do not overwrite)
-        access_mode = 'a'
 
-        # do not print a header
-        write_header = False
+    # show the progress messages of the download (see codis.py) on the
+    # terminal, like the output of this script
+    logging.basicConfig( stream = sys.stdout, level = logging.INFO,
+                         format = '%(message)s' )
 
-        # fetch the last observation from the file without reading the whole
-        # file
-        with open(output_path,'rb') as f:
 
-            # go to the second last byte of the file (just in case there is a
-            # trailing line break)
-            f.seek(-2,2)
+    # indicate progress
+    # display a header consisting of the current date padded with hyphens
+    term_print(('\n{:-^80}'.format(datetime.now().strftime('%Y-%m-%d %H:%M'))))
 
-            # search backwards for a line break
-            while f.read(1) != b'\n':
+    # indicate progress
+    term_print('Reading configuration file:')
 
-                # step back by two positions (using f.read(1) above to check
-                # for the line break always pushes the position another step
-                # forward)
-                f.seek(-2,1)
+    # read and validate the configuration file
+    try:
+        config = load_config(config_path)
 
-            # read the line
-            lastObservation = f.readline().decode('utf-8')
+    except ConfigError as e:
 
-        # extract the date, i.e. first column
-        start_date = lastObservation.split(',')[0]
+        # display error message
+        term_print(str(e))
 
-        # convert date from string to date object
-        start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
+        # cancel script execution
+        return 1
 
-    else:
+    # the user decided to quit (nothing is wrong)
+    except Cancelled:
+        return 0
 
-        # set parameters for the to_csv-method:
-        # create a new file
-        access_mode = 'w'
-
-        # print a header
-        write_header = True
-
-
-    # create iterable date range
-    period = date_range( start = start_date, end = end_date, freq = 'd' )
-
-    # check download period: Continue with the next station if files are up to
-    # date
-    if len(period) == 0:
-
-        # indicate progress
-        print('File is already up to date. Proceeding with the next station!')
-
-        # continue with the next station
-        continue
-
-
-    # create empty DataFrame
-    df = DataFrame()
-
-    # loop over all days within the period
-    for day in period:
-
-        # indicate progress
-        print( '> fetching', day.strftime( '%Y-%m-%d' ) )
-
-        # assemble URL
-        full_URL = ( "{}&station={}&stname={}&datepicker={}".format(
-                    base_URL, value['station'], quote(quote(value['stname'])),
-                    day.strftime('%Y-%m-%d')) )
-
-        # read html table into a temporary DataFrame:
-        # > the table of interest is called 'MyTable'
-        # > skip the (condensed) columns heading
-        # > use the first row as header
-        # > use the first column as index
-        # > treat the following as NA values (see the readme at
-        #   http://e-service.cwb.gov.tw/HistoryDataQuery/downloads/Readme.pdf)
-        #   > 'X': instrument malfunction
-        #   > 'V': wind with no mean wind direction
-        #   > '/': status unknown
-        # > replace the value of 'T', i.e. precipitation < 0.1mm ('trace'),
-        #   by 0.05 (Kristen's choice)
-        # > do not return a list of length one, but the DataFrame itself
-        tmp = read_html( io         = full_URL,
-                         attrs      = { 'id' : 'MyTable' },
-                         encoding   = 'utf-8',
-                         skiprows   = 1,
-                         header     = 0,
-                         index_col  = 0,
-                         converters = { '降水量(mm)Precp' : lambda x: 0.05 if x=='T' else x },
-                         na_values  = ['X','V','/'] )[0]
-
-        # no observation data in this interval ( 本段時間區間內無觀測資料。)
-        if len(tmp) == 0:
-
-            # indicate progress
-            print('  ! no data in this interval')
-
-            # skip rest of the loop
-            continue
-
-        # indicate progress
-        print( '  + formatting data' )
-
-        # replace the index by the current date and time
-        # note: '1' corresponds to 1:00 a.m., '2' is 2:00 a.m., etc. Be aware
-        #       that '12' is actually 0:00 a.m. the following day!
-        tmp.index = to_datetime( tmp.index, unit = 'h',
-                                 origin = Timestamp(day) )
-
-        # split DateTimeIndex into date and time MultiIndex
-        tmp.index = MultiIndex.from_arrays([tmp.index.strftime('%Y-%m-%d'),
-                                            tmp.index.strftime('%H:%M')],
-                                            names = ['Date','Time'])
-
-        # rename columns
-        tmp.rename( columns = {
-            '測站氣壓(hPa)StnPres'          : 'station pressure [hPa]'   ,
-            '海平面氣壓(hPa)SeaPres'        : 'sea level pressure [hPa]' ,
-            '氣溫(℃)Temperature'            : 'temperature [°C]'         ,
-            '露點溫度(℃)Td dew point'       : 'dew point [°C]'           ,
-            '相對溼度(%)RH'                 : 'relative humidity [%]'    ,
-            '風速(m/s)WS'                   : 'wind speed [m/s]'         ,
-            '風向(360degree)WD'             : 'wind direction [360°]'    ,
-            '最大陣風(m/s)WSGust'           : 'gust speed [m/s]'         ,
-            '最大陣風風向(360degree)WDGust' : 'gust direction [360°]'    ,
-            '降水量(mm)Precp'               : 'precipitation [mm]'       ,
-            '降水時數(hr)PrecpHour'         : 'precipitation hours [h]'  ,
-            '日照時數(hr)SunShine'          : 'sun shine hours [h]'      ,
-            '全天空日射量(MJ/㎡)GloblRad'   : 'global radiation [MJ/m²]' ,
-            '能見度(km)Visb'                : 'visibility [km]'          },
-            inplace = True )
-
-        # drop empty rows
-        tmp.dropna(axis = 0, how = 'all')
-
-        # indicate progress
-        print( '  + appending to data frame' )
-
-        # append working table to the DataFrame
-        df = df.append( tmp, verify_integrity = True )
 
+    # download the observations of all stations
+    process_stations( config.station_list, config.start_date, config.end_date,
+                      config.data_directory, config.compress, config.cache )
 
     # indicate progress
-    print('> writing data to', output_path )
+    print('\nDone!\n')
+
+    return 0
 
-    # write DataFrame to file
-    df.to_csv( output_path, mode = access_mode, header = write_header )
 
-# indicate progress
-print('\nDone!\n')
+if __name__ == '__main__':
+    raise SystemExit(main())